@@ -0,0 +1,90 @@
+"""
+Audio splits the download of an audio track into a network-bound fetch stage and a CPU-bound transcode stage, so that
+each stage can run on its own independently sized executor.
+
+dependencies:
+    - ffmpeg and ffprobe must be installed.
+"""
+
+from os import cpu_count, path, remove, rename
+from subprocess import run
+from yt_dlp import YoutubeDL
+
+FETCH_WORKERS = 16
+TRANSCODE_WORKERS = cpu_count() or 1
+
+def fetch_audio(download_path: str, file_name: str, url: str) -> str:
+
+    """
+    Download the best available audio stream of the video without converting it. A stream that was already downloaded
+    by a previous run is not downloaded again.
+
+    args:
+        download_path (str): Directory to save the audio stream in.
+        file_name (str): Name of the audio file without the extension.
+        url (str): URL of the video.
+
+    returns:
+        str: Path to the downloaded audio stream.
+
+    raises:
+        yt_dlp.utils.DownloadError: If the audio stream cannot be downloaded.
+    """
+
+    with YoutubeDL(params={"format": "bestaudio/best",
+                           "outtmpl": path.join(download_path, f"{file_name}.%(ext)s"),
+                           "quiet": True}) as downloader:
+        return downloader.prepare_filename(downloader.extract_info(url=url, download=True))
+
+def get_audio_codec(file_path: str) -> str:
+
+    """
+    Read the codec of the first audio stream of the file using ffprobe.
+
+    args:
+        file_path (str): Path to the audio file.
+
+    returns:
+        str: The name of the codec, e.g. 'mp3', 'opus' or 'aac'.
+
+    raises:
+        subprocess.CalledProcessError: If ffprobe fails to read the file.
+    """
+
+    return run(args=["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name",
+                     "-of", "default=noprint_wrappers=1:nokey=1", file_path],
+               capture_output=True, check=True, text=True).stdout.strip()
+
+def transcode_to_mp3(file_path: str) -> str:
+
+    """
+    Convert the audio file to mp3 using ffmpeg and remove the source file. The conversion is skipped when the audio
+    stream is already encoded as mp3, in which case the file is only renamed to have the '.mp3' extension. YouTube
+    rarely serves mp3, but other sites supported by yt-dlp do.
+
+    args:
+        file_path (str): Path to the audio file.
+
+    returns:
+        str: Path to the mp3 file.
+
+    raises:
+        subprocess.CalledProcessError: If ffprobe or ffmpeg fails.
+    """
+
+    mp3_path = f"{path.splitext(file_path)[0]}.mp3"
+
+    if get_audio_codec(file_path) == "mp3":
+        if file_path != mp3_path:
+            rename(file_path, mp3_path)
+    else:
+        source_path = file_path
+        if file_path == mp3_path:
+            source_path = f"{file_path}.source"
+            rename(file_path, source_path)
+        run(args=["ffmpeg", "-y", "-loglevel", "error", "-i", source_path, "-vn", "-codec:a", "libmp3lame", "-q:a",
+                  "0", mp3_path],
+            check=True)
+        remove(source_path)
+
+    return mp3_path
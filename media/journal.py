@@ -0,0 +1,229 @@
+"""
+Journal records the state of every download job in a SQLite table so that an interrupted run resumes where it stopped
+and failed jobs are retried with exponential backoff.
+
+Schema of the jobs table
+
+    Column Name	        Data Type
+
+    job_id    	        text
+    payload 	        text (JSON)
+    status	            text (pending, running, done, failed)
+    attempts            integer
+    last_error          text
+    updated_at          real (UNIX timestamp)
+"""
+
+import json
+import sqlite3
+import time
+
+from concurrent import futures
+from contextlib import closing
+from os import cpu_count
+from pandas import DataFrame, read_sql_query
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+def connect(journal_path: str) -> sqlite3.Connection:
+
+    """
+    Open the journal at the given path, creating the jobs table if it does not exist yet.
+
+    args:
+        journal_path (str): Path to the SQLite journal file.
+
+    returns:
+        sqlite3.Connection: A connection to the journal.
+
+    raises:
+        None
+    """
+
+    connection = sqlite3.connect(journal_path)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at REAL
+        )""")
+    connection.commit()
+    return connection
+
+def enqueue_jobs(journal_path: str, jobs: Dict[str, Dict[str, Any]]) -> None:
+
+    """
+    Add jobs to the journal as pending. Jobs already present in the journal keep their recorded state, so re-enqueuing
+    the same jobs on a resumed run does not repeat finished work. Failed jobs are reset to pending with a fresh attempt
+    budget, so a track that failed during e.g. a network outage is tried again by the next run.
+
+    args:
+        journal_path (str): Path to the SQLite journal file.
+        jobs (Dict[str, Dict[str, Any]]): Mapping of job ID to the JSON serialisable payload passed to the worker.
+
+    returns:
+        None
+
+    raises:
+        None
+    """
+
+    with closing(connect(journal_path)) as connection, connection:
+        connection.executemany("INSERT INTO jobs (job_id, payload, status, updated_at) VALUES (?, ?, ?, ?) "
+                               "ON CONFLICT (job_id) DO UPDATE SET payload = excluded.payload, "
+                               "status = excluded.status, attempts = 0, updated_at = excluded.updated_at "
+                               "WHERE jobs.status = ?",
+                               [(job_id, json.dumps(payload), PENDING, time.time(), FAILED)
+                                for job_id, payload in jobs.items()])
+
+def reset_failed_jobs(journal_path: str) -> None:
+
+    """
+    Reset every failed job of the journal to pending with a fresh attempt budget, for callers that do not re-enqueue
+    the jobs of previous runs.
+
+    args:
+        journal_path (str): Path to the SQLite journal file.
+
+    returns:
+        None
+
+    raises:
+        None
+    """
+
+    with closing(connect(journal_path)) as connection, connection:
+        connection.execute("UPDATE jobs SET status = ?, attempts = 0, updated_at = ? WHERE status = ?",
+                           (PENDING, time.time(), FAILED))
+
+def get_jobs(journal_path: str) -> DataFrame:
+
+    """
+    Read the state of all the jobs recorded in the journal.
+
+    args:
+        journal_path (str): Path to the SQLite journal file.
+
+    returns:
+        DataFrame: A DataFrame with the job_id, status, attempts and last_error of every job.
+
+    raises:
+        None
+    """
+
+    with closing(connect(journal_path)) as connection:
+        return read_sql_query(sql="SELECT job_id, status, attempts, last_error FROM jobs", con=connection)
+
+def get_backoff_delay(attempts: int, backoff: float) -> float:
+
+    """
+    Calculate the delay before the next attempt of a job, doubling with every failed attempt.
+
+    args:
+        attempts (int): Number of attempts already made.
+        backoff (float): Delay in seconds after the first failed attempt.
+
+    returns:
+        float: The delay in seconds.
+
+    raises:
+        None
+    """
+
+    return backoff * 2 ** (attempts - 1) if attempts > 0 else 0.0
+
+def run_jobs(journal_path: str,
+             stages: List[Tuple[Callable[[Any], Any], Optional[int]]],
+             max_attempts: int = 5,
+             backoff: float = 30.0) -> DataFrame:
+
+    """
+    Run every unfinished job of the journal through a chain of stages, recording the outcome of each attempt. The first
+    stage is called with the payload of the job and every following stage with the result of the previous one. Each
+    stage runs on its own thread pool, so that e.g. network-bound and CPU-bound stages can be sized independently.
+
+    Jobs left running by an interrupted run are reset to pending. A job whose stage raises an exception is marked as
+    failed and retried from the first stage after an exponentially growing delay until it has been attempted
+    max_attempts times in total, counting the attempts of interrupted runs. With the defaults, the retries of a job span
+    about 7.5 minutes.
+
+    At most as many jobs as the first stage has worker threads are submitted at a time. When the run is interrupted, the
+    jobs not started yet are cancelled and the jobs in progress are reset to pending without using up an attempt.
+
+    args:
+        journal_path (str): Path to the SQLite journal file.
+        stages (List[Tuple[Callable[[Any], Any], Optional[int]]]): The function of every stage paired with its number
+            of worker threads, None for the ThreadPoolExecutor default.
+        max_attempts (int): Maximum number of attempts per job.
+        backoff (float): Delay in seconds after the first failed attempt.
+
+    returns:
+        DataFrame: A DataFrame with the final state of every job.
+
+    raises:
+        None
+    """
+
+    with closing(connect(journal_path)) as connection:
+        with connection:
+            connection.execute("UPDATE jobs SET status = ? WHERE status = ?", (PENDING, RUNNING))
+
+        queue: List[Tuple[float, str, Dict[str, Any]]] = [
+            (updated_at + get_backoff_delay(attempts, backoff), job_id, json.loads(payload))
+            for job_id, payload, attempts, updated_at in connection.execute(
+                "SELECT job_id, payload, attempts, updated_at FROM jobs WHERE status IN (?, ?) AND attempts < ?",
+                (PENDING, FAILED, max_attempts))]
+
+        executors = [futures.ThreadPoolExecutor(max_workers=max_workers) for _, max_workers in stages]
+        capacity = stages[0][1] or min(32, (cpu_count() or 1) + 4)
+        running: Dict[futures.Future, Tuple[str, Dict[str, Any], int]] = {}
+
+        try:
+            while queue or running:
+                now = time.time()
+                for job in sorted(job for job in queue if job[0] <= now):
+                    if sum(1 for _, _, stage in running.values() if stage == 0) >= capacity:
+                        break
+                    queue.remove(job)
+                    _, job_id, payload = job
+                    with connection:
+                        connection.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                                           "WHERE job_id = ?", (RUNNING, now, job_id))
+                    running[executors[0].submit(stages[0][0], payload)] = (job_id, payload, 0)
+
+                deadlines = [job[0] for job in queue if job[0] > now]
+                timeout = max(min(deadlines) - time.time(), 0) if deadlines else None
+                completed, _ = futures.wait(running, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+
+                for future in completed:
+                    job_id, payload, stage = running.pop(future)
+                    error = future.exception()
+                    if not error and stage + 1 < len(stages):
+                        running[executors[stage + 1].submit(stages[stage + 1][0], future.result())] = \
+                            (job_id, payload, stage + 1)
+                        continue
+                    with connection:
+                        connection.execute("UPDATE jobs SET status = ?, last_error = ?, updated_at = ? "
+                                           "WHERE job_id = ?",
+                                           (FAILED if error else DONE, repr(error) if error else None, time.time(),
+                                            job_id))
+                    if error:
+                        (attempts,) = connection.execute("SELECT attempts FROM jobs WHERE job_id = ?",
+                                                         (job_id,)).fetchone()
+                        if attempts < max_attempts:
+                            queue.append((time.time() + get_backoff_delay(attempts, backoff), job_id, payload))
+        except BaseException:
+            for executor in executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            with connection:
+                connection.executemany("UPDATE jobs SET status = ?, attempts = attempts - 1 WHERE job_id = ?",
+                                       [(PENDING, job_id) for job_id, _, _ in running.values()])
+            raise
+        for executor in executors:
+            executor.shutdown()
+
+    return get_jobs(journal_path)
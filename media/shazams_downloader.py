@@ -6,23 +6,60 @@ The script:
 
     1. Extracts records from the Shazam CSV data file, removes duplicates and irrelevant columns.
     2. Retrieves YouTube URLs for the music.
-    3. Downloads the best audio stream for the track from YouTube as mp3 file.
+    3. Downloads the best audio stream for the track from YouTube and converts it to mp3 file on separate network and
+       CPU sized thread pools, recording the state of every download in a journal so that an interrupted run resumes
+       where it stopped and failed downloads are retried.
     4. Saves the report of the download process as a CSV file.
 
+In incremental mode, the script persists a high-water mark of the Shazam `date` column and an index of the tracks seen
+by previous runs, and only processes the Shazams added to the CSV data file since the last run. Downloads that failed in
+previous runs are retried on every run.
+
 dependencies:
-    - yt-dlp requires ffmpeg to be installed.
+    - yt-dlp requires ffmpeg and ffprobe to be installed.
 
 usage:
-    python3 shazams_downloader.py **/SyncedShazams.csv
+    python3 shazams_downloader.py [--incremental] **/SyncedShazams.csv
 """
 
-from concurrent import futures
+import sqlite3
+
+from audio import fetch_audio, FETCH_WORKERS, transcode_to_mp3, TRANSCODE_WORKERS
+from contextlib import closing
+from hashlib import sha1
+from journal import enqueue_jobs, reset_failed_jobs, run_jobs
 from os import listdir, path
-from pandas import DataFrame, read_csv
+from pandas import concat, DataFrame, read_csv, Series, Timestamp, to_datetime
 from sys import argv
-from youtube import download_audio_as_mp3, get_video_id, search_youtube
+from typing import List, Optional, Tuple
+from youtube import get_video_id, search_youtube
 
 DOWNLOADS_PATH = path.expanduser("~/Downloads/")
+JOURNAL_PATH = path.join(DOWNLOADS_PATH, "shazams_downloader_journal.sqlite")
+SYNC_STATE_PATH = path.join(DOWNLOADS_PATH, "shazams_downloader_sync.sqlite")
+
+def connect_sync_state(state_path: str) -> sqlite3.Connection:
+
+    """
+    Open the incremental sync state at the given path, creating its tables if they do not exist yet. The watermark table
+    holds the fingerprints of the rows with the latest processed date and the tracks table the index of every track
+    processed by previous runs.
+
+    args:
+        state_path (str): Path to the SQLite sync state file.
+
+    returns:
+        sqlite3.Connection: A connection to the sync state.
+
+    raises:
+        None
+    """
+
+    connection = sqlite3.connect(state_path)
+    connection.execute("CREATE TABLE IF NOT EXISTS watermark (date TEXT NOT NULL, fingerprint TEXT PRIMARY KEY)")
+    connection.execute("CREATE TABLE IF NOT EXISTS tracks (artist TEXT, title TEXT, PRIMARY KEY (artist, title))")
+    connection.commit()
+    return connection
 
 def extract_shazams(file_path: str) -> DataFrame:
 
@@ -41,6 +78,135 @@ def extract_shazams(file_path: str) -> DataFrame:
         .drop(columns=["date", "latitude", "longitude", "status"], errors="ignore") \
         .sort_values(by=["artist", "title"])
 
+def extract_new_shazams(file_path: str,
+                        state_path: str,
+                        chunk_size: int = 10000) -> Tuple[DataFrame, Tuple[Optional[Timestamp], List[str]]]:
+
+    """
+    Extract the Shazam tracks added since the last incremental sync, streaming the CSV file in chunks. A row is new
+    when its date is later than the watermark, or equal to it with a fingerprint that was not processed yet. Only the
+    rows dated at the watermark are fingerprinted, so older rows are discarded by a vectorised date comparison. New rows
+    are deduplicated among themselves and against the index of tracks processed by previous runs.
+
+    Rows whose date cannot be parsed are never new; they are listed on the console on every run.
+
+    The sync state is not modified; pass the returned watermark to update_sync_state once the tracks are handed off.
+
+    args:
+        file_path (str): Path to the Shazam CSV file.
+        state_path (str): Path to the SQLite sync state file.
+        chunk_size (int): Number of rows read from the CSV file at a time.
+
+    returns:
+        Tuple[DataFrame, Tuple[Optional[Timestamp], List[str]]]: A DataFrame containing the new unique Shazam tracks
+        and the new watermark, i.e. the latest date and the fingerprints of the rows with that date.
+    """
+
+    with closing(connect_sync_state(state_path)) as connection:
+        watermark = connection.execute("SELECT date, fingerprint FROM watermark").fetchall()
+        tracks = set(connection.execute("SELECT artist, title FROM tracks").fetchall())
+
+    last_date: Optional[Timestamp] = Timestamp(watermark[0][0]) if watermark else None
+    last_fingerprints: List[str] = [fingerprint for _, fingerprint in watermark]
+    mark_date, mark_fingerprints = last_date, list(last_fingerprints)
+    new_shazams: List[DataFrame] = []
+    unparsed_shazams: List[DataFrame] = []
+
+    for chunk in read_csv(filepath_or_buffer=file_path, chunksize=chunk_size, dtype=str, keep_default_na=False):
+        dates = to_datetime(chunk["date"], errors="coerce", format="mixed", utc=True)
+        unparsed_shazams.append(chunk[dates.isna()])
+
+        if last_date is None:
+            is_new = dates.notna()
+        else:
+            is_at_mark = dates == last_date
+            is_processed = get_fingerprints(chunk[is_at_mark]).isin(last_fingerprints) \
+                .reindex(chunk.index, fill_value=False).astype(bool)
+            is_new = (dates > last_date) | (is_at_mark & ~is_processed)
+
+        chunk, dates = chunk[is_new], dates[is_new]
+
+        if not chunk.empty:
+            chunk_date = dates.max()
+            if mark_date is None or chunk_date > mark_date:
+                mark_date, mark_fingerprints = chunk_date, []
+            if chunk_date == mark_date:
+                mark_fingerprints += get_fingerprints(chunk[dates == mark_date]).tolist()
+
+        new_shazams.append(chunk[~chunk[["artist", "title"]].apply(tuple, axis=1, result_type="reduce").isin(tracks)]
+                           .drop_duplicates(subset=["artist", "title"]))
+
+    unparsed: DataFrame = concat([DataFrame(columns=["date", "artist", "title"])] + unparsed_shazams)
+    if not unparsed.empty:
+        print(f"Skipped {len(unparsed)} Shazams with an unparseable date, run without --incremental to include them:\n"
+              + "\n".join(f"{row['date']!r}: {row['title']} {row['artist']}"
+                          for row in unparsed.to_dict(orient="records")))
+
+    return concat([DataFrame(columns=["artist", "title"])] + new_shazams, ignore_index=True) \
+        .drop_duplicates(subset=["artist", "title"]) \
+        .drop(columns=["date", "latitude", "longitude", "status"], errors="ignore") \
+        .sort_values(by=["artist", "title"]), (mark_date, mark_fingerprints)
+
+def get_fingerprints(shazams: DataFrame) -> Series:
+
+    """
+    Calculate the SHA-1 fingerprint of every raw Shazam row, used to tell apart rows that share the same date.
+
+    args:
+        shazams (DataFrame): Shazam rows read from the CSV file as strings.
+
+    returns:
+        Series: A Series of hexadecimal fingerprints indexed like the rows.
+    """
+
+    return shazams.apply(lambda row: sha1("\x1f".join(row.tolist()).encode()).hexdigest(), axis=1,
+                         result_type="reduce")
+
+def update_sync_state(state_path: str,
+                      shazams: DataFrame,
+                      watermark: Tuple[Optional[Timestamp], List[str]]) -> None:
+
+    """
+    Persist the watermark and add the processed tracks to the track index of the incremental sync state.
+
+    args:
+        state_path (str): Path to the SQLite sync state file.
+        shazams (DataFrame): The processed Shazam tracks.
+        watermark (Tuple[Optional[Timestamp], List[str]]): The latest date and the fingerprints of the rows with
+            that date, as returned by extract_new_shazams.
+
+    returns:
+        None
+    """
+
+    mark_date, mark_fingerprints = watermark
+
+    with closing(connect_sync_state(state_path)) as connection, connection:
+        connection.executemany("INSERT OR IGNORE INTO tracks (artist, title) VALUES (?, ?)",
+                               shazams[["artist", "title"]].itertuples(index=False, name=None))
+        if mark_date is not None:
+            connection.execute("DELETE FROM watermark WHERE date != ?", (mark_date.isoformat(),))
+            connection.executemany("INSERT OR IGNORE INTO watermark (date, fingerprint) VALUES (?, ?)",
+                                   [(mark_date.isoformat(), fingerprint) for fingerprint in mark_fingerprints])
+
+def fetch_track(track: dict) -> str:
+
+    """
+    Download the best available audio stream of the track without converting it to mp3.
+
+    args:
+        track (dict): The track record containing the title, artist, url and video_id.
+
+    returns:
+        str: Path to the downloaded audio stream.
+
+    raises:
+        yt_dlp.utils.DownloadError: If the audio stream cannot be downloaded.
+    """
+
+    return fetch_audio(download_path=DOWNLOADS_PATH,
+                       file_name=f"{track['title']} {track['artist']} {track['video_id']}",
+                       url=track["url"])
 
 def is_audio_downloaded(video_id):
 
@@ -71,23 +237,36 @@ def main() -> None:
     Main function to orchestrate the extraction of Shazam data, retrieval of YouTube URLs and download the audio tracks.
     """
 
-    if len(argv) != 2:
-        print(f"Usage: python3 {argv[0]} **/SyncedShazams.csv")
+    is_incremental = argv[1:2] == ["--incremental"]
+
+    if len(argv) != 2 + is_incremental or argv[-1] == "--incremental":
+        print(f"Usage: python3 {argv[0]} [--incremental] **/SyncedShazams.csv")
     else:
-        shazams: DataFrame = (extract_shazams(file_path=argv[1])
+        if is_incremental:
+            new_shazams, watermark = extract_new_shazams(file_path=argv[-1], state_path=SYNC_STATE_PATH)
+        else:
+            new_shazams = extract_shazams(file_path=argv[-1])
+
+        shazams: DataFrame = (new_shazams
                               .assign(
-            url=lambda x: x.apply(lambda row: search_youtube(f"{row['title']} {row['artist']} lyrics")[0], axis=1)
+            url=lambda x: x.apply(lambda row: search_youtube(f"{row['title']} {row['artist']} lyrics")[0], axis=1,
+                                  result_type="reduce")
             , video_id=lambda x: x['url'].apply(get_video_id)))
 
         shazams.to_csv(path_or_buf=f"{DOWNLOADS_PATH}/shazams_downloader_report.csv", index=False)
 
-        with futures.ThreadPoolExecutor() as executor:
-            executor.map(lambda row: download_audio_as_mp3(download_path=DOWNLOADS_PATH,
-                                                           file_name=f"{row["title"]} {row["artist"]} {row["video_id"]}",
-                                                           url=row["url"]),
-                         shazams.to_dict(orient="records"))
+        enqueue_jobs(journal_path=JOURNAL_PATH,
+                     jobs={row["video_id"]: {key: row[key] for key in ["title", "artist", "url", "video_id"]}
+                           for row in shazams.to_dict(orient="records")})
+        if is_incremental:
+            update_sync_state(state_path=SYNC_STATE_PATH, shazams=shazams, watermark=watermark)
+            reset_failed_jobs(journal_path=JOURNAL_PATH)
+        jobs: DataFrame = run_jobs(journal_path=JOURNAL_PATH,
+                                   stages=[(fetch_track, FETCH_WORKERS), (transcode_to_mp3, TRANSCODE_WORKERS)])
 
-        (shazams.assign(is_downloaded=lambda x: x["video_id"].apply(is_audio_downloaded))
+        (shazams.merge(jobs, how="left", left_on="video_id", right_on="job_id")
+         .drop(columns=["job_id"])
+         .assign(is_downloaded=lambda x: x["video_id"].apply(is_audio_downloaded))
          .to_csv(path_or_buf=f"{DOWNLOADS_PATH}/shazams_downloader_report.csv", index=False))
 
 if __name__ == "__main__":
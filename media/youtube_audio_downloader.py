@@ -6,24 +6,45 @@ The script:
 
     1. Reads the `url` column from the CSV file.
     2. Retrieves YouTube video title and author name for the video.
-    3. Downloads the best audio stream for the YouTube video as mp3 file.
+    3. Downloads the best audio stream for the YouTube video and converts it to mp3 file on separate network and CPU
+       sized thread pools, recording the state of every download in a journal so that an interrupted run resumes where
+       it stopped and failed downloads are retried.
     4. Saves the report of the download process as a CSV file.
 
 dependencies:
-    - yt-dlp requires ffmpeg to be installed.
+    - yt-dlp requires ffmpeg and ffprobe to be installed.
 
 usage:
     python3 youtube_audio_downloader.py **/url.csv
 """
 
-from concurrent import futures
+from audio import fetch_audio, FETCH_WORKERS, transcode_to_mp3, TRANSCODE_WORKERS
+from journal import enqueue_jobs, run_jobs
 from os import listdir, path
 from pandas import DataFrame, read_csv
 from re import sub
 from sys import argv
-from youtube import download_audio_as_mp3, get_video_id, get_video_metadata
+from youtube import get_video_id, get_video_metadata
 
 DOWNLOADS_PATH = path.expanduser("~/Downloads/")
+JOURNAL_PATH = path.join(DOWNLOADS_PATH, "youtube_audio_downloader_journal.sqlite")
+
+def fetch_video(video: dict) -> str:
+
+    """
+    Download the best available audio stream of the YouTube video without converting it to mp3.
+
+    args:
+        video (dict): The video record containing the name, url and video_id.
+
+    returns:
+        str: Path to the downloaded audio stream.
+
+    raises:
+        yt_dlp.utils.DownloadError: If the audio stream cannot be downloaded.
+    """
+
+    return fetch_audio(download_path=DOWNLOADS_PATH, file_name=video["name"], url=video["url"])
 
 def is_audio_downloaded(video_id: str) -> bool:
 
@@ -72,13 +93,15 @@ def main() -> None:
 
         url.to_csv(path_or_buf=f"{DOWNLOADS_PATH}/youtube_audio_downloader_report.csv", index=False)
 
-        with futures.ThreadPoolExecutor() as executor:
-            executor.map(lambda row: download_audio_as_mp3(download_path=DOWNLOADS_PATH,
-                                                           file_name=(row["name"]),
-                                                           url=row["url"]),
-                         url.to_dict(orient="records"))
+        enqueue_jobs(journal_path=JOURNAL_PATH,
+                     jobs={row["video_id"]: {key: row[key] for key in ["name", "url", "video_id"]}
+                           for row in url.to_dict(orient="records")})
+        jobs: DataFrame = run_jobs(journal_path=JOURNAL_PATH,
+                                   stages=[(fetch_video, FETCH_WORKERS), (transcode_to_mp3, TRANSCODE_WORKERS)])
 
-        (url.assign(is_downloaded=lambda x: x["video_id"].apply(is_audio_downloaded))
+        (url.merge(jobs, how="left", left_on="video_id", right_on="job_id")
+         .drop(columns=["job_id"])
+         .assign(is_downloaded=lambda x: x["video_id"].apply(is_audio_downloaded))
          .to_csv(path_or_buf=f"{DOWNLOADS_PATH}/youtube_audio_downloader_report.csv", index=False))
 
 if __name__ == "__main__":